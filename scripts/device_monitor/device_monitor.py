@@ -1,10 +1,22 @@
 import appdaemon.plugins.hass.hassapi as hass
 from influxdb import InfluxDBClient
-from datetime import datetime, timezone
-import statistics
-from typing import List, Dict, Tuple, Optional, Callable
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+import heapq
+import logging
+import time
+import numpy as np
+from typing import List, Dict, Tuple
 from enum import Enum
 
+# InfluxDB is queried with epoch='ns', so all sample and segment times are integer nanoseconds
+NS_PER_MINUTE = 60_000_000_000
+
 
 class AlertKind(Enum):
     """Alert types for device monitoring."""
@@ -22,32 +34,127 @@ class AlertState(Enum):
     PENDING = "pending"
 
 
-def tparse(ts: str) -> Optional[datetime]:
-    """Parse InfluxDB ISO8601 timestamp into timezone-aware datetime."""
-    if not ts:
-        return None
-    try:
-        if ts.endswith("Z"):
-            ts = ts[:-1] + "+00:00"
-        dt = datetime.fromisoformat(ts)
-        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
-    except (ValueError, AttributeError):
-        return None
+# Phase indices; the alert helpers index these per-phase (active, inactive) tables instead of branching
+PHASE_ACTIVE = 0
+PHASE_INACTIVE = 1
+PHASE_NAMES = ("active", "inactive")
+ALERT_LABELS = ("active", "idle")
+LONG_ALERT_KINDS = (AlertKind.ACTIVE_LONG, AlertKind.IDLE_LONG)
+PEND_REASON_ATTRS = ("pend_active_reason", "pend_idle_reason")
+PEND_SINCE_ATTRS = ("pend_active_since", "pend_idle_since")
+LAST_DURATION_FIELDS = ("last_active_minutes", "last_inactive_minutes")
+
+# String forms written to InfluxDB, resolved once instead of through Enum.value on every record
+ALERT_STATE_NAMES = {state: state.value for state in AlertState}
+ALERT_KIND_NAMES = {kind: kind.value for kind in AlertKind}
+
+
+def iso_timestamp(ns: int) -> str:
+    """Format a nanosecond epoch as a local ISO 8601 timestamp for alert fields."""
+    return datetime.fromtimestamp(ns / 1e9).astimezone().isoformat()
+
+
+def escape_measurement(value: str) -> str:
+    """Escape a measurement name for InfluxDB line protocol."""
+    return value.replace(",", "\\,").replace(" ", "\\ ")
+
+
+def escape_tag(value: str) -> str:
+    """Escape a tag key or value for InfluxDB line protocol."""
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def format_field(value) -> str:
+    """Format a field value for InfluxDB line protocol: strings are quoted, everything else is a float."""
+    if isinstance(value, str):
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return repr(float(value))
+
+
+class RunningMedian:
+    """Sliding-window median using two heaps with lazy deletion: O(log n) add/remove, O(1) median."""
+
+    def __init__(self):
+        self._lo = []  # max-heap (negated values) holding the lower half
+        self._hi = []  # min-heap holding the upper half
+        self._lo_size = 0  # live element counts, excluding values pending deletion
+        self._hi_size = 0
+        self._pending = {}  # value -> number of copies removed but still inside a heap
+
+    def __len__(self) -> int:
+        return self._lo_size + self._hi_size
+
+    def add(self, value: float):
+        """Insert a value."""
+        if not self._lo or value <= -self._lo[0]:
+            heapq.heappush(self._lo, -value)
+            self._lo_size += 1
+        else:
+            heapq.heappush(self._hi, value)
+            self._hi_size += 1
+        self._rebalance()
+
+    def remove(self, value: float):
+        """Remove a value previously added; it is dropped from its heap once it reaches the top."""
+        self._pending[value] = self._pending.get(value, 0) + 1
+        if self._lo and value <= -self._lo[0]:
+            self._lo_size -= 1
+        else:
+            self._hi_size -= 1
+        self._prune()
+        self._rebalance()
+
+    def median(self) -> float:
+        """Return the median of the live values, or 0.0 when empty."""
+        if not len(self):
+            return 0.0
+        if self._lo_size > self._hi_size:
+            return -self._lo[0]
+        return (-self._lo[0] + self._hi[0]) / 2
+
+    def _rebalance(self):
+        """Keep the lower half equal to or one larger than the upper half."""
+        if self._lo_size > self._hi_size + 1:
+            heapq.heappush(self._hi, -heapq.heappop(self._lo))
+            self._lo_size -= 1
+            self._hi_size += 1
+        elif self._lo_size < self._hi_size:
+            heapq.heappush(self._lo, -heapq.heappop(self._hi))
+            self._hi_size -= 1
+            self._lo_size += 1
+        else:
+            return
+        self._prune()
+
+    def _prune(self):
+        """Pop values pending deletion off both heap tops."""
+        for heap, sign in ((self._lo, -1), (self._hi, 1)):
+            while heap and self._pending.get(sign * heap[0]):
+                value = sign * heapq.heappop(heap)
+                self._pending[value] -= 1
+                if not self._pending[value]:
+                    del self._pending[value]
 
 
 class DeviceMonitor(hass.Hass):
     """Monitors a power entity, detects activity cycles, and triggers alerts or logs to InfluxDB."""
 
+    # Queued InfluxDB points are flushed once this many accumulate or write_flush_seconds pass
+    WRITE_BATCH_POINTS = 100
+    # Below this many new samples a plain scan beats the fixed overhead of the NumPy edge detection
+    VECTORIZE_MIN_SAMPLES = 64
+
     def initialize(self):
         """Initialize configuration, connect to InfluxDB, and start the periodic task."""
         try:
             self._load_config()
+            self._init_queries()
             self._init_influx_client()
             self._init_state()
             self._send_startup_notification()
             self._start_monitoring()
         except Exception as e:
-            self.log(f"Initialization failed: {e}", level="ERROR")
+            self._log_err("Initialization failed", e)
             raise
 
     def _load_config(self):
@@ -70,6 +177,8 @@ class DeviceMonitor(hass.Hass):
         self.debug_logging = args.get("debug_logging", False)
         self.send_test_notification = args.get("send_test_notification", False)
         self.statistic_method = args.get("statistic_method", "median").lower()
+        self.aggregate_samples = args.get("aggregate_samples", False)
+        self.write_flush_seconds = float(args.get("write_flush_seconds", 30))
         
         # Validation
         if self.threshold_watt <= 0:
@@ -84,23 +193,78 @@ class DeviceMonitor(hass.Hass):
             self.log("Both margin_percent and margin_minutes set - using margin_minutes", level="WARNING")
         if self.statistic_method not in ["median", "mean"]:
             raise ValueError("statistic_method must be either 'median' or 'mean'")
+        if self.write_flush_seconds < 0:
+            raise ValueError("write_flush_seconds must be non-negative")
+
+        self._min_interval_ns = int(self.min_interval * NS_PER_MINUTE)
+        self._history_window_ns = self.history_window_hours * 60 * NS_PER_MINUTE
+
+        # Position of the configured statistic within each (mean, median) pair, resolved once
+        self._stat_offset = 0 if self.statistic_method == "mean" else 1
+
+        # Samples are kept as float32, so compare against a float32 threshold to stay in that dtype
+        self._threshold32 = np.float32(self.threshold_watt)
+
+        # Margin limits as plain arithmetic: lower = max(0, x * lo_mul + lo_add), upper = x * up_mul + up_add
+        if self.margin_minutes > 0:
+            self._lo_mul, self._lo_add = 1.0, -self.margin_minutes
+            self._up_mul, self._up_add = 1.0, self.margin_minutes
+        else:
+            self._lo_mul, self._lo_add = 1 - self.margin_percent / 100, 0.0
+            self._up_mul, self._up_add = 1 + self.margin_percent / 100, 0.0
+        self._margin_str = f"{self.margin_minutes}m" if self.margin_minutes > 0 else f"{self.margin_percent}%"
+
+        # Server-side aggregation buckets are a tenth of min_interval so cycle edges keep their resolution
+        self.aggregate_seconds = max(1, int(self.min_interval * 60 / 10))
+
+    def _init_queries(self):
+        """Build the constant InfluxQL statements; per-tick values are passed as bind parameters."""
+        if self.aggregate_samples:
+            # Let InfluxDB downsample to buckets instead of returning every raw sample; MAX keeps a bucket
+            # active if any sample in it crossed the threshold, where MEAN could average a short burst away
+            select = "SELECT MAX(value) AS value FROM W"
+            group = f" GROUP BY time({self.aggregate_seconds}s) fill(previous)"
+            # Resume at the bucket after the last consumed one so no bucket is read twice
+            since = "time >= $since"
+            self._resume_offset_ns = self.aggregate_seconds * 1_000_000_000
+        else:
+            select = "SELECT value, time FROM W"
+            group = ""
+            since = "time > $since"
+            self._resume_offset_ns = 0
+
+        # One statement serves both the initial full-window fetch and the incremental ones
+        self._query = f"{select} WHERE entity_id=$entity_id AND {since}{group} ORDER BY time ASC"
 
     def _init_influx_client(self):
         """Initialize InfluxDB client with error handling."""
         args = self.args
         try:
+            session = requests.Session()
             self.client = InfluxDBClient(
                 host=args["influx_host"],
                 port=int(args["influx_port"]),
                 username=args["influx_user"],
                 password=args["influx_password"],
                 database=args["influx_db"],
-                timeout=5
+                timeout=5,
+                session=session
+            )
+            # The client mounts its own adapter on the session; replace it with a small keep-alive pool
+            # that also retries transient gateway errors instead of failing the tick
+            adapter = HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=4,
+                max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504))
             )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            # Batched writes go out on a single background worker so tick does not wait for the POST
+            self._write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="device_monitor_write")
             # Test connection
             self.client.ping()
         except Exception as e:
-            self.log(f"InfluxDB connection failed: {e}", level="ERROR")
+            self._log_err("InfluxDB connection failed", e)
             raise
 
     def _init_state(self):
@@ -121,18 +285,68 @@ class DeviceMonitor(hass.Hass):
         self.alert_timestamp = ""
         self.last_alert_time = None
         
+        # Incremental history cache: only samples newer than _last_query_ts are fetched each tick,
+        # the phase state machine carries over between ticks and completed segments are kept in deques
+        self._last_query_ts = 0
+        self._active_segments = deque()
+        self._idle_segments = deque()
+        self._active_median = RunningMedian()
+        self._idle_median = RunningMedian()
+        # Running duration totals for the means; integer ns keeps add/evict exact without compensation
+        self._active_total_ns = 0
+        self._idle_total_ns = 0
+        self._last_state = None
+        self._active_start = None
+        self._last_active_end = None
+        self._recent_active = 0.0
+        self._recent_idle = 0.0
+        self._phase = PHASE_INACTIVE
+        self._phase_anchor_ns = None
+
+        # Statistics and per-phase alert limits, recomputed only when new samples arrive
+        self._stats = (0.0, 0.0, 0.0, 0.0)
+        self._stat = (0.0, 0.0)
+        self._lower = (0.0, 0.0)
+        self._upper = (0.0, 0.0)
+
+        # Line-protocol points waiting to be written to InfluxDB in one batch
+        self._line_prefix = f"{escape_measurement(self.measurement)},entity={escape_tag(self.entity)} "
+        self._write_buffer = []
+        self._last_flush_ns = time.time_ns()
+
+        # Per ended phase record templates; constant fields are filled once and the rest is overwritten
+        # in place on every flip (safe because _write_influx serializes the fields immediately)
+        self._field_templates = tuple(
+            {
+                "phase": PHASE_NAMES[ended],
+                "mean_active_minutes": 0.0,
+                "median_active_minutes": 0.0,
+                "mean_inactive_minutes": 0.0,
+                "median_inactive_minutes": 0.0,
+                "statistic_method": self.statistic_method,
+                "alert_state": "",
+                "alert_kind": "",
+                "alert_ts": "",
+                "pend_idle_reason": "",
+                "pend_idle_since": "",
+                "pend_active_reason": "",
+                "pend_active_since": "",
+                LAST_DURATION_FIELDS[ended]: 0.0,
+            }
+            for ended in (PHASE_ACTIVE, PHASE_INACTIVE)
+        )
+
         # Processing flag to prevent overlapping executions
         self.processing = False
 
     def _send_startup_notification(self):
         """Send a test notification on startup if configured."""
         if self.send_test_notification:
-            margin_str = f"{self.margin_minutes}m" if self.margin_minutes else f"{self.margin_percent}%"
             message = (
                 f"DeviceMonitor started for {self.entity}\n"
                 f"Threshold: {self.threshold_watt}W\n"
                 f"Min interval: {self.min_interval}m\n"
-                f"Margin: {margin_str}\n"
+                f"Margin: {self._margin_str}\n"
                 f"Statistic: {self.statistic_method}\n"
                 f"Check interval: {self.check_interval}s"
             )
@@ -147,17 +361,16 @@ class DeviceMonitor(hass.Hass):
                 else:
                     self.log("send_test_notification is true but notify_service not configured", level="WARNING")
             except Exception as e:
-                self.log(f"Failed to send startup notification: {e}", level="ERROR")
+                self._log_err("Failed to send startup notification", e)
 
     def _start_monitoring(self):
         """Start the periodic monitoring task."""
         self.run_every(self.tick, self.datetime(), self.check_interval)
-        margin_str = f"{self.margin_minutes}m" if self.margin_minutes else f"{self.margin_percent}%"
         self.log(
             f"DeviceMonitor initialized for {self.entity} | "
             f"threshold={self.threshold_watt}W | "
             f"min_interval={self.min_interval}m | "
-            f"margin={margin_str} | "
+            f"margin={self._margin_str} | "
             f"statistic={self.statistic_method} | "
             f"history={self.history_window_hours}h | "
             f"check_interval={self.check_interval}s | "
@@ -166,46 +379,77 @@ class DeviceMonitor(hass.Hass):
 
     # ---------------- InfluxDB and notify helpers ----------------
     
-    def _fetch_recent_points(self) -> List[Dict]:
-        """Fetch recent power samples from InfluxDB for the configured entity."""
+    def _log_err(self, tag: str, e: Exception):
+        """Log a caught exception; kept out of line so the guarded hot paths stay small."""
+        self.log(f"{tag}: {e}", level="ERROR")
+
+    def _fetch_recent_points(self, now_ns: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Fetch (ns timestamps, float32 watts) arrays of samples newer than the last processed one, or the full window on first run."""
+        times = array("q")
+        values = array("f")
         try:
-            query = (
-                f"SELECT value, time FROM W "
-                f"WHERE entity_id='{self.entity}' "
-                f"AND time > now() - {self.history_window_hours}h "
-                f"ORDER BY time ASC"
-            )
-            points = list(self.client.query(query).get_points())
+            # Resume after the last processed sample, but never reach back past the history window
+            # (first run, or an outage longer than the window)
+            since = max(self._last_query_ts + self._resume_offset_ns, now_ns - self._history_window_ns)
+            bind_params = {"entity_id": self.entity, "since": since}
+
+            # Stream the response chunk by chunk into typed arrays; rows are read straight from the raw
+            # series ("time" first, then "value") instead of building a dict per point via get_points()
+            for result in self.client.query(self._query, bind_params=bind_params, epoch="ns",
+                                            chunked=True, chunk_size=10000):
+                for series in result.raw.get("series", []):
+                    for timestamp, value in series["values"]:
+                        if value is not None:
+                            times.append(timestamp)
+                            values.append(value)
+            if self.aggregate_samples and times:
+                # The newest bucket is still filling; pick it up on a later tick once complete
+                del times[-1]
+                del values[-1]
             if self.debug_logging:
-                self.log(f"Fetched {len(points)} data points from InfluxDB")
-            return points
+                self.log(f"Fetched {len(times)} data points from InfluxDB")
         except Exception as e:
-            self.log(f"InfluxDB query failed: {e}", level="ERROR")
-            return []
+            self._log_err("InfluxDB query failed", e)
+            del times[:]
+            del values[:]
+        return np.frombuffer(times, dtype=np.int64), np.frombuffer(values, dtype=np.float32)
+
+    def _write_influx(self, now_ns: int, fields: Dict):
+        """Queue computed fields for the ended phase interval; _flush_writes sends them to InfluxDB."""
+        field_set = ",".join(f"{key}={format_field(value)}" for key, value in fields.items())
+        self._write_buffer.append(f"{self._line_prefix}{field_set} {now_ns // 1_000_000_000}")
+        if self.debug_logging:
+            self.log(f"Queued InfluxDB write: {fields}")
+
+    def _flush_writes(self, now_ns: int, force: bool = False):
+        """Write queued points in one request once the batch is full, the flush interval elapsed or forced."""
+        if not self._write_buffer:
+            return
+        if (not force and len(self._write_buffer) < self.WRITE_BATCH_POINTS
+                and now_ns - self._last_flush_ns < self.write_flush_seconds * 1e9):
+            return
 
-    def _write_influx(self, now: datetime, fields: Dict):
-        """Write computed fields for the ended phase interval into InfluxDB."""
+        batch, self._write_buffer = self._write_buffer, []
+        self._last_flush_ns = now_ns
+        self._write_pool.submit(self._send_batch, batch)
+
+    def _send_batch(self, batch: List[str]):
+        """Send one batch of line protocol points; runs on the write worker."""
         try:
-            self.client.write_points([{
-                "measurement": self.measurement,
-                "tags": {"entity": self.entity},
-                "time": now.isoformat(),
-                "fields": fields
-            }])
+            self.client.write_points(batch, protocol="line", time_precision="s", batch_size=1000)
             if self.debug_logging:
-                self.log(f"Wrote to InfluxDB: {fields}")
+                self.log(f"Wrote {len(batch)} points to InfluxDB")
         except Exception as e:
-            self.log(f"Influx write error: {e}", level="ERROR")
+            self._log_err("Influx write error", e)
 
-    def _notify(self, message: str):
+    def _notify(self, message: str, now_ns: int):
         """Send a Home Assistant notification with cooldown to prevent spam."""
         if not self.notify_service:
             return
         
         # Check cooldown
-        now = datetime.now()
         if self.last_alert_time:
-            elapsed = (now - self.last_alert_time).total_seconds() / 60
+            elapsed = (now_ns - self.last_alert_time) / NS_PER_MINUTE
             if elapsed < self.alert_cooldown_minutes:
                 self.log(f"Alert suppressed (cooldown: {elapsed:.1f}m < {self.alert_cooldown_minutes}m)")
                 return
@@ -216,213 +460,200 @@ class DeviceMonitor(hass.Hass):
                 title="Device Alert",
                 message=f"{self.entity}: {message}"
             )
-            self.last_alert_time = now
+            self.last_alert_time = now_ns
             self.log(f"Alert sent: {message}")
         except Exception as e:
-            self.log(f"Notify error: {e}", level="ERROR")
+            self._log_err("Notify error", e)
 
     # ---------------- Data analysis helpers ----------------
     
-    def _extract_activity_segments(self, samples: List[Dict]) -> Tuple:
-        """Return active intervals and timing info by thresholding power samples."""
-        if not samples:
-            return [], False, None, 0.0, 0.0
+    def _extract_activity_segments(self, times: np.ndarray, values: np.ndarray) -> List[Tuple]:
+        """Advance the phase state over new power samples and return newly completed active intervals."""
+        if not len(times):
+            return []
         
         active_segments = []
-        active_start = None
-        last_state = float(samples[0]["value"]) > self.threshold_watt
-        last_active_end = None
-        recent_active_duration = 0.0
-        recent_idle_duration = 0.0
-
-        for sample in samples:
-            timestamp = tparse(sample["time"])
-            if not timestamp:
-                continue
-            timestamp = timestamp.astimezone()
-            is_active = float(sample["value"]) > self.threshold_watt
+        if self._last_state is None:
+            self._last_state = bool(values[0] > self._threshold32)
+
+        if len(values) < self.VECTORIZE_MIN_SAMPLES:
+            # Incremental ticks usually bring only a handful of samples
+            threshold = float(self._threshold32)
+            state = self._last_state
+            edges = []
+            for idx, value in enumerate(values.tolist()):
+                if (value > threshold) != state:
+                    state = not state
+                    edges.append(idx)
+        else:
+            # Only samples where the state differs from the previous one (or the carried-over state) matter;
+            # XOR of neighbouring states is set exactly at those transitions
+            active = values > self._threshold32
+            states = np.concatenate(([self._last_state], active)).view(np.uint8)
+            edges = np.flatnonzero(states[1:] ^ states[:-1])
+
+        # Transitions alternate, so the new state at each edge is the opposite of the one before it
+        is_active = self._last_state
+        for idx in edges:
+            timestamp = int(times[idx])
+            is_active = not is_active
             
-            if is_active != last_state:
-                if is_active:  # became active
-                    if last_active_end:
-                        recent_idle_duration = (timestamp - last_active_end).total_seconds() / 60
-                    active_start = timestamp
-                else:  # became inactive
-                    if active_start:
-                        duration = (timestamp - active_start).total_seconds() / 60
-                        recent_active_duration = duration
-                        if duration >= self.min_interval:
-                            active_segments.append((active_start, timestamp))
-                    active_start = None
-                    last_active_end = timestamp
-                last_state = is_active
-
-        return active_segments, last_state, active_start, recent_active_duration, recent_idle_duration
-
-    def _extract_idle_segments(self, active_segments: List[Tuple]) -> List[Tuple]:
-        """Compute idle intervals between active phases that exceed minimum duration."""
-        if len(active_segments) < 2:
+            if is_active:  # became active
+                if self._last_active_end is not None:
+                    self._recent_idle = (timestamp - self._last_active_end) / NS_PER_MINUTE
+                self._active_start = timestamp
+            else:  # became inactive
+                if self._active_start is not None:
+                    duration = (timestamp - self._active_start) / NS_PER_MINUTE
+                    self._recent_active = duration
+                    if duration >= self.min_interval:
+                        active_segments.append((self._active_start, timestamp))
+                self._active_start = None
+                self._last_active_end = timestamp
+
+        self._last_state = is_active
+        return active_segments
+
+    def _extract_idle_segments(self, starts: np.ndarray, ends: np.ndarray) -> List[Tuple]:
+        """Compute idle intervals between consecutive active phases that exceed minimum duration."""
+        if len(starts) < 2:
             return []
-        return [
-            (active_segments[i - 1][1], active_segments[i][0])
-            for i in range(1, len(active_segments))
-            if (active_segments[i][0] - active_segments[i - 1][1]).total_seconds() / 60 >= self.min_interval
-        ]
-
-    def _compute_statistics(self, active_segments: List[Tuple], idle_segments: List[Tuple]) -> Tuple[float, float, float, float]:
-        """Compute mean and median active and idle durations."""
-        def calculate_durations(segments):
-            if not segments:
-                return 0.0, 0.0
-            durations = [(b - a).total_seconds() / 60 for a, b in segments]
-            if len(durations) == 0:
-                return 0.0, 0.0
-            mean_val = statistics.mean(durations)
-            median_val = statistics.median(durations)
-            return mean_val, median_val
-        
-        mean_active, median_active = calculate_durations(active_segments)
-        mean_idle, median_idle = calculate_durations(idle_segments)
-        return mean_active, median_active, mean_idle, median_idle
-
-    def _get_selected_statistic(self, mean_val: float, median_val: float) -> float:
-        """Return the configured statistic (mean or median)."""
-        return mean_val if self.statistic_method == "mean" else median_val
-
-    def _get_margin_limits(self) -> Tuple[Callable, Callable]:
-        """Return lower and upper bound functions based on configured margin."""
-        if self.margin_minutes > 0:
-            return (
-                lambda x: max(0, x - self.margin_minutes),
-                lambda x: x + self.margin_minutes
-            )
-        return (
-            lambda x: x * (1 - self.margin_percent / 100),
-            lambda x: x * (1 + self.margin_percent / 100)
+        idle_starts, idle_ends = ends[:-1], starts[1:]
+        keep = idle_ends - idle_starts >= self._min_interval_ns
+        return list(zip(idle_starts[keep].tolist(), idle_ends[keep].tolist()))
+
+    def _update_segment_cache(self, new_segments: List[Tuple], now_ns: int):
+        """Append newly completed segments and evict those that started outside the history window."""
+        if new_segments:
+            previous = [self._active_segments[-1]] if self._active_segments else []
+            bounds = np.array(previous + new_segments, dtype=np.int64)
+            new_idle = self._extract_idle_segments(bounds[:, 0], bounds[:, 1])
+            self._active_segments.extend(new_segments)
+            self._idle_segments.extend(new_idle)
+            for start, end in new_segments:
+                self._active_median.add((end - start) / NS_PER_MINUTE)
+                self._active_total_ns += end - start
+            for start, end in new_idle:
+                self._idle_median.add((end - start) / NS_PER_MINUTE)
+                self._idle_total_ns += end - start
+
+        cutoff = now_ns - self._history_window_ns
+        while self._active_segments and self._active_segments[0][0] <= cutoff:
+            start, end = self._active_segments.popleft()
+            self._active_median.remove((end - start) / NS_PER_MINUTE)
+            self._active_total_ns -= end - start
+        # An idle gap goes together with the active segment preceding it
+        first_start = self._active_segments[0][0] if self._active_segments else None
+        while self._idle_segments and (first_start is None or self._idle_segments[0][0] < first_start):
+            start, end = self._idle_segments.popleft()
+            self._idle_median.remove((end - start) / NS_PER_MINUTE)
+            self._idle_total_ns -= end - start
+
+    def _compute_statistics(self) -> Tuple[float, float, float, float]:
+        """Read mean and median active and idle durations from the running aggregates."""
+        def calculate_mean(total_ns, count):
+            return total_ns / count / NS_PER_MINUTE if count else 0.0
+
+        mean_active = calculate_mean(self._active_total_ns, len(self._active_segments))
+        mean_idle = calculate_mean(self._idle_total_ns, len(self._idle_segments))
+        return mean_active, self._active_median.median(), mean_idle, self._idle_median.median()
+
+    def _update_statistics(self):
+        """Recompute cached statistics and per-phase alert limits from the cached segments."""
+        self._stats = self._compute_statistics()
+
+        # Select the configured statistic for alert calculations, indexed by phase
+        stat_active = self._stats[self._stat_offset]
+        stat_idle = self._stats[2 + self._stat_offset]
+        self._stat = (stat_active, stat_idle)
+        self._lower = (
+            max(0.0, stat_active * self._lo_mul + self._lo_add),
+            max(0.0, stat_idle * self._lo_mul + self._lo_add),
+        )
+        self._upper = (
+            stat_active * self._up_mul + self._up_add,
+            stat_idle * self._up_mul + self._up_add,
         )
 
-    def _current_phase_info(self, is_active: bool, active_start: Optional[datetime],
-                           active_segments: List[Tuple]) -> Tuple[str, float, float, datetime]:
-        """Determine current phase (active/inactive), elapsed duration, and timestamp."""
-        now = datetime.now().astimezone()
-        
-        if is_active:
-            anchor = active_start if active_start else (active_segments[-1][1] if active_segments else now)
-            elapsed = (now - anchor).total_seconds() / 60
-            return "active", elapsed, 0.0, now
-        
-        if not active_segments:
-            return "inactive", 0.0, 0.0, now
-        
-        last_end = active_segments[-1][1]
-        elapsed = (now - last_end).total_seconds() / 60
-        return "inactive", 0.0, elapsed, now
+    def _update_phase_anchor(self):
+        """Cache the current phase and the timestamp its elapsed duration is measured from."""
+        last_end = self._active_segments[-1][1] if self._active_segments else None
+        if self._last_state:
+            self._phase = PHASE_ACTIVE
+            self._phase_anchor_ns = self._active_start if self._active_start is not None else last_end
+        else:
+            self._phase = PHASE_INACTIVE
+            self._phase_anchor_ns = last_end
+
+    def _current_phase_info(self, now_ns: int) -> Tuple[int, float]:
+        """Determine current phase index and its elapsed duration in minutes."""
+        elapsed = (now_ns - self._phase_anchor_ns) / NS_PER_MINUTE if self._phase_anchor_ns is not None else 0.0
+        return self._phase, elapsed
 
     # ---------------- Alert and state management ----------------
     
-    def _check_immediate_alert(self, phase: str, curr_active: float, curr_idle: float,
-                              stat_active: float, stat_idle: float,
-                              lo: Callable, up: Callable) -> Tuple[bool, str, AlertKind]:
-        """Check for immediate long-interval alerts."""
-        if phase == "active" and stat_active > 0 and curr_active >= self.min_interval:
-            if curr_active > up(stat_active):
-                return (
-                    True,
-                    f"active too long: {curr_active:.1f}m > {up(stat_active):.1f}m",
-                    AlertKind.ACTIVE_LONG
-                )
-        
-        if phase == "inactive" and stat_idle > 0 and curr_idle >= self.min_interval:
-            if curr_idle > up(stat_idle):
-                return (
-                    True,
-                    f"idle too long: {curr_idle:.1f}m > {up(stat_idle):.1f}m",
-                    AlertKind.IDLE_LONG
-                )
-        
+    def _check_immediate_alert(self, phase: int, elapsed: float) -> Tuple[bool, str, AlertKind]:
+        """Check for an immediate long-interval alert on the current phase."""
+        upper = self._upper[phase]
+        if self._stat[phase] > 0 and elapsed >= self.min_interval and elapsed > upper:
+            return (
+                True,
+                f"{ALERT_LABELS[phase]} too long: {elapsed:.1f}m > {upper:.1f}m",
+                LONG_ALERT_KINDS[phase]
+            )
         return False, "", AlertKind.NONE
 
-    def _handle_pending_alerts(self, phase: str, curr_active: float, curr_idle: float):
+    def _handle_pending_alerts(self, phase: int, elapsed: float, now_ns: int):
         """Fire delayed 'too short' alerts when phase persists beyond min_interval."""
-        if phase == "active" and self.pend_idle_reason:
-            if curr_active >= self.min_interval:
-                # Clear BEFORE notifying to prevent any re-entry issues
-                reason = self.pend_idle_reason
-                self.pend_idle_reason = ""
-                self.pend_idle_since = ""
-                self._notify(reason)
-                self.log(f"Fired pending idle_short alert after buffer period")
-        elif phase == "inactive" and self.pend_active_reason:
-            if curr_idle >= self.min_interval:
-                # Clear BEFORE notifying to prevent any re-entry issues
-                reason = self.pend_active_reason
-                self.pend_active_reason = ""
-                self.pend_active_since = ""
-                self._notify(reason)
-                self.log(f"Fired pending active_short alert after buffer period")
-
-    def _on_phase_flip(self, flipped: bool, now: datetime, phase: str,
-                      mean_active: float, median_active: float, mean_idle: float, median_idle: float,
-                      stat_active: float, stat_idle: float, lo: Callable, up: Callable,
-                      recent_active: float, recent_idle: float):
+        # A pending alert always belongs to the phase before the current one
+        ended = 1 - phase
+        reason = getattr(self, PEND_REASON_ATTRS[ended])
+        if reason and elapsed >= self.min_interval:
+            # Clear BEFORE notifying to prevent any re-entry issues
+            setattr(self, PEND_REASON_ATTRS[ended], "")
+            setattr(self, PEND_SINCE_ATTRS[ended], "")
+            self._notify(reason, now_ns)
+            self.log(f"Fired pending {ALERT_LABELS[ended]}_short alert after buffer period")
+
+    def _on_phase_flip(self, flipped: bool, now_ns: int, phase: int):
         """Handle actions at phase flip: resolve alerts, set pending states, write DB entry."""
         if not flipped:
             return
 
-        # Clear opposite-phase pending alerts to prevent stale alerts
-        if phase == "active":
-            # We just became active, clear any pending active alerts
-            self.pend_active_reason = ""
-            self.pend_active_since = ""
-        else:
-            # We just became inactive, clear any pending idle alerts
-            self.pend_idle_reason = ""
-            self.pend_idle_since = ""
+        ended = self.prev_phase
+        recent = (self._recent_active, self._recent_idle)[ended]
+        label = ALERT_LABELS[ended]
+
+        # Clear pending alerts of the phase that just started to prevent stale alerts
+        setattr(self, PEND_REASON_ATTRS[phase], "")
+        setattr(self, PEND_SINCE_ATTRS[phase], "")
 
         # Clear alert state when phase ends
-        if self.alert_state == AlertState.ALERT:
-            if self.prev_kind == AlertKind.ACTIVE_LONG and self.prev_phase == "active":
-                self._notify(f"active long interval ended (duration {recent_active:.1f}m)")
-                self.alert_state = AlertState.OK
-                self.alert_kind = AlertKind.NONE
-            elif self.prev_kind == AlertKind.IDLE_LONG and self.prev_phase == "inactive":
-                self._notify(f"idle long interval ended (duration {recent_idle:.1f}m)")
-                self.alert_state = AlertState.OK
-                self.alert_kind = AlertKind.NONE
-
-        # Set pending short alerts for the phase that just ended
-        if self.prev_phase == "active" and stat_active > 0:
-            if self.min_interval <= recent_active < lo(stat_active):
-                self.pend_active_reason = f"active too short: {recent_active:.1f}m < {lo(stat_active):.1f}m"
-                self.pend_active_since = now.isoformat()
-        elif self.prev_phase == "inactive" and stat_idle > 0:
-            if self.min_interval <= recent_idle < lo(stat_idle):
-                self.pend_idle_reason = f"idle too short: {recent_idle:.1f}m < {lo(stat_idle):.1f}m"
-                self.pend_idle_since = now.isoformat()
+        if self.alert_state == AlertState.ALERT and self.prev_kind == LONG_ALERT_KINDS[ended]:
+            self._notify(f"{label} long interval ended (duration {recent:.1f}m)", now_ns)
+            self.alert_state = AlertState.OK
+            self.alert_kind = AlertKind.NONE
+
+        # Set pending short alert for the phase that just ended
+        lower = self._lower[ended]
+        if self._stat[ended] > 0 and self.min_interval <= recent < lower:
+            setattr(self, PEND_REASON_ATTRS[ended], f"{label} too short: {recent:.1f}m < {lower:.1f}m")
+            setattr(self, PEND_SINCE_ATTRS[ended], iso_timestamp(now_ns))
 
         # Write phase completion to InfluxDB with both mean and median
-        fields = {
-            "phase": self.prev_phase,
-            "mean_active_minutes": mean_active,
-            "median_active_minutes": median_active,
-            "mean_inactive_minutes": mean_idle,
-            "median_inactive_minutes": median_idle,
-            "statistic_method": self.statistic_method,
-            "alert_state": self.alert_state.value,
-            "alert_kind": self.alert_kind.value,
-            "alert_ts": self.alert_timestamp,
-            "pend_idle_reason": self.pend_idle_reason,
-            "pend_idle_since": self.pend_idle_since,
-            "pend_active_reason": self.pend_active_reason,
-            "pend_active_since": self.pend_active_since,
-        }
-        
-        if self.prev_phase == "active":
-            fields["last_active_minutes"] = recent_active
-        elif self.prev_phase == "inactive":
-            fields["last_inactive_minutes"] = recent_idle
-        
-        self._write_influx(now, fields)
+        fields = self._field_templates[ended]
+        (fields["mean_active_minutes"], fields["median_active_minutes"],
+         fields["mean_inactive_minutes"], fields["median_inactive_minutes"]) = self._stats
+        fields["alert_state"] = ALERT_STATE_NAMES[self.alert_state]
+        fields["alert_kind"] = ALERT_KIND_NAMES[self.alert_kind]
+        fields["alert_ts"] = self.alert_timestamp
+        fields["pend_idle_reason"] = self.pend_idle_reason
+        fields["pend_idle_since"] = self.pend_idle_since
+        fields["pend_active_reason"] = self.pend_active_reason
+        fields["pend_active_since"] = self.pend_active_since
+        fields[LAST_DURATION_FIELDS[ended]] = recent
+
+        self._write_influx(now_ns, fields)
 
     # ---------------- Main tick loop ----------------
     
@@ -435,95 +666,91 @@ class DeviceMonitor(hass.Hass):
         
         self.processing = True
         try:
-            self._process_tick()
+            # One clock reading per tick; everything downstream works in integer nanoseconds
+            now_ns = time.time_ns()
+            self._process_tick(now_ns)
+            self._flush_writes(now_ns)
         except Exception as e:
-            self.log(f"Error in tick processing: {e}", level="ERROR")
+            self._log_err("Error in tick processing", e)
             import traceback
             self.log(traceback.format_exc(), level="ERROR")
         finally:
             self.processing = False
 
-    def _process_tick(self):
+    def _process_tick(self, now_ns: int):
         """Internal tick processing logic."""
-        samples = self._fetch_recent_points()
-        if not samples:
+        times, values = self._fetch_recent_points(now_ns)
+        if len(times):
+            # Only new samples can change segments and statistics; otherwise the cached ones are reused
+            self._last_query_ts = int(times[-1])
+            self._update_segment_cache(self._extract_activity_segments(times, values), now_ns)
+            self._update_phase_anchor()
+            self._update_statistics()
+        elif self._last_state is None:
             self.log("No samples retrieved from InfluxDB", level="WARNING")
             return
 
-        # Extract activity segments
-        active_segments, is_active, active_start, recent_active, recent_idle = self._extract_activity_segments(samples)
-        if not active_segments:
+        if not self._active_segments:
             if self.debug_logging:
                 self.log("No valid active segments found in history")
             return
 
-        # Compute statistics
-        idle_segments = self._extract_idle_segments(active_segments)
-        mean_active, median_active, mean_idle, median_idle = self._compute_statistics(active_segments, idle_segments)
-        
-        # Select the configured statistic for alert calculations
-        stat_active = self._get_selected_statistic(mean_active, median_active)
-        stat_idle = self._get_selected_statistic(mean_idle, median_idle)
-        lo, up = self._get_margin_limits()
-        phase, curr_active, curr_idle, now = self._current_phase_info(is_active, active_start, active_segments)
+        phase, elapsed = self._current_phase_info(now_ns)
         
         # Detect phase flip (skip on first run when prev_phase is None)
         flipped = self.prev_phase is not None and self.prev_phase != phase
 
         # Check for immediate alerts
-        in_alert, reason, kind = self._check_immediate_alert(
-            phase, curr_active, curr_idle, stat_active, stat_idle, lo, up
-        )
+        in_alert, reason, kind = self._check_immediate_alert(phase, elapsed)
         
         # Update alert state and notify
         if in_alert and (self.alert_state != AlertState.ALERT or self.alert_kind != kind):
             self.alert_state = AlertState.ALERT
             self.alert_kind = kind
-            self.alert_timestamp = now.isoformat()
-            self._notify(reason)
+            self.alert_timestamp = iso_timestamp(now_ns)
+            self._notify(reason, now_ns)
         elif not in_alert and self.alert_state == AlertState.ALERT:
             # Clear alert if condition resolved without phase flip
             self.alert_state = AlertState.OK
             self.alert_kind = AlertKind.NONE
 
         # Handle pending alerts
-        self._handle_pending_alerts(phase, curr_active, curr_idle)
+        self._handle_pending_alerts(phase, elapsed, now_ns)
         
         # Handle phase flip
-        self._on_phase_flip(flipped, now, phase, mean_active, median_active, mean_idle, median_idle,
-                          stat_active, stat_idle, lo, up, recent_active, recent_idle)
+        self._on_phase_flip(flipped, now_ns, phase)
 
         # Logging
-        self._log_status(phase, curr_active, curr_idle, stat_active, stat_idle, lo, up, in_alert, reason)
+        changed = flipped or (kind if in_alert else AlertKind.NONE) != self.prev_kind
+        self._log_status(phase, elapsed, in_alert, reason, changed)
 
         # Update state
         self.prev_phase = phase
         self.prev_kind = kind if in_alert else AlertKind.NONE
 
-    def _log_status(self, phase: str, curr_active: float, curr_idle: float,
-                   stat_active: float, stat_idle: float, lo: Callable, up: Callable,
-                   in_alert: bool, reason: str):
-        """Log current monitoring status."""
-        stat_label = self.statistic_method
-        
-        if phase == "active":
-            status = f"ALERT: {reason}" if in_alert else "OK"
-            self.log(
-                f"{self.entity}: active={curr_active:.1f}m, {stat_label}={stat_active:.1f}m, "
-                f"limits=[{lo(stat_active):.1f}, {up(stat_active):.1f}], {status}"
-            )
-        else:
-            status = f"ALERT: {reason}" if in_alert else "OK"
-            self.log(
-                f"{self.entity}: inactive={curr_idle:.1f}m, {stat_label}={stat_idle:.1f}m, "
-                f"limits=[{lo(stat_idle):.1f}, {up(stat_idle):.1f}], {status}"
-            )
+    def _log_status(self, phase: int, elapsed: float, in_alert: bool, reason: str, changed: bool):
+        """Log current monitoring status; at INFO only when phase or alert changed, otherwise at DEBUG."""
+        # Unchanged ticks log at DEBUG, which is normally disabled; skip building the call at all then
+        level = "INFO" if changed or self.debug_logging else "DEBUG"
+        if level == "DEBUG" and not self.get_main_log().isEnabledFor(logging.DEBUG):
+            return
+        # %-style arguments so the message is only formatted if the level is enabled
+        status = "ALERT: " + reason if in_alert else "OK"
+        self.log(
+            "%s: %s=%.1fm, %s=%.1fm, limits=[%.1f, %.1f], %s",
+            self.entity, PHASE_NAMES[phase], elapsed, self.statistic_method, self._stat[phase],
+            self._lower[phase], self._upper[phase], status,
+            level=level
+        )
 
     def terminate(self):
         """Clean up resources on shutdown."""
         try:
             if hasattr(self, 'client'):
+                self._flush_writes(time.time_ns(), force=True)
+                # Let queued writes finish before the session goes away
+                self._write_pool.shutdown(wait=True)
                 self.client.close()
                 self.log("InfluxDB connection closed")
         except Exception as e:
-            self.log(f"Error during termination: {e}", level="ERROR")
\ No newline at end of file
+            self._log_err("Error during termination", e)
\ No newline at end of file